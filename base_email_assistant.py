@@ -1,38 +1,271 @@
 import imaplib
 import email
+import email.policy
+import math
+import mmap
 import os
+import random
+import re
+import socket
+from email.generator import BytesGenerator
 from email.message import EmailMessage
+from io import BytesIO
 from datetime import datetime
-import json
 import time
-from typing import List, Dict
-import yaml
+from typing import Any, List, Dict, Optional, Tuple
+import orjson
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Matches the sequence number starting a FETCH response, and its UID item
+FETCH_NUM_RE = re.compile(rb'^(\d+) ')
+UID_RE = re.compile(rb'\bUID (\d+)')
+
+# Parses a LIST response line into its flags and (possibly quoted) name
+LIST_RE = re.compile(rb'\((?P<flags>[^)]*)\) (?:"[^"]*"|NIL) (?P<name>.+)')
+
+# Folder names to look for when the server doesn't flag its drafts folder
+DRAFT_FOLDERS = ['Drafts', 'Draft', '[Gmail]/Drafts', 'INBOX/Drafts']
+
+# Blacklist entries sent to the server as NOT FROM terms, to stay well
+# under IMAP command line length limits
+BLACKLIST_SEARCH_TERMS = 30
+
+# Probe the connection with NOOP before use once it has been idle this long
+IMAP_PROBE_AFTER = 60
+
+# RFC 2177 asks clients to re-issue IDLE at least every 29 minutes
+IDLE_TIMEOUT = 29 * 60
+
+# Only the headers we use plus the text, skipping the full header block.
+# BODY.PEEK leaves the \Seen flag to mark_as_read.
+FETCH_SPEC = (
+    '(INTERNALDATE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT REPLY-TO '
+    'CONTENT-TYPE CONTENT-TRANSFER-ENCODING)] BODY.PEEK[TEXT])'
+)
+
+# Delay before retrying after an error doubles from the minimum up to the
+# maximum while errors repeat, and resets after a successful cycle
+RETRY_DELAY_MIN = 5
+RETRY_DELAY_MAX = 300
+
+# Seconds an LLM request may take before the provider client gives up
+LLM_TIMEOUT = 120
+
+# Adaptive polling: arrivals from the last week are smoothed into a
+# time-of-day density using 5-minute bins and a 30-minute Gaussian kernel
+DAY_SECONDS = 24 * 60 * 60
+ARRIVAL_WINDOW = 7 * DAY_SECONDS
+ARRIVAL_BINS = 288
+ARRIVAL_BANDWIDTH = 30 * 60
+MIN_ARRIVALS = 20
+MIN_POLL_DELAY = 60
+
+
+def next_poll_delay(arrivals: List[float], polls_per_day: int, now: float) -> float:
+    """Seconds until the next poll, placing polls_per_day polls to minimise detection delay.
+
+    Given the arrival density p(t) and its cumulative F(t), successive poll
+    times follow L_i = L_{i-1} + (F(L_{i-1}) - F(L_{i-2})) / p(L_{i-1}).
+    The first delay is found by bisection so the schedule spans one day.
+    """
+    bin_width = DAY_SECONDS / ARRIVAL_BINS
+
+    counts = [0] * ARRIVAL_BINS
+    for arrival in arrivals:
+        counts[int(arrival % DAY_SECONDS // bin_width)] += 1
+
+    kernel = []
+    for offset in range(ARRIVAL_BINS):
+        distance = min(offset, ARRIVAL_BINS - offset) * bin_width
+        kernel.append(math.exp(-0.5 * (distance / ARRIVAL_BANDWIDTH) ** 2))
+
+    smoothed = [
+        sum(count * kernel[(b - j) % ARRIVAL_BINS] for j, count in enumerate(counts) if count)
+        for b in range(ARRIVAL_BINS)
+    ]
+
+    # Mix in a uniform floor so quiet hours still get polled
+    total = sum(smoothed) * bin_width
+    density = [0.9 * value / total + 0.1 / DAY_SECONDS for value in smoothed]
+    cumulative = [0.0]
+    for value in density:
+        cumulative.append(cumulative[-1] + value * bin_width)
+
+    def cdf(t: float) -> float:
+        days, offset = divmod(t, DAY_SECONDS)
+        b = min(int(offset // bin_width), ARRIVAL_BINS - 1)
+        return days + cumulative[b] + density[b] * (offset - b * bin_width)
+
+    def pdf(t: float) -> float:
+        return density[min(int(t % DAY_SECONDS // bin_width), ARRIVAL_BINS - 1)]
+
+    start = now % DAY_SECONDS
+
+    def schedule_end(first_delay: float) -> float:
+        previous, current = start, start + first_delay
+        for _ in range(polls_per_day - 1):
+            if current - start > DAY_SECONDS:
+                break
+            previous, current = current, current + (cdf(current) - cdf(previous)) / pdf(current)
+        return current
+
+    low, high = 0.0, float(DAY_SECONDS)
+    for _ in range(50):
+        middle = (low + high) / 2
+        if schedule_end(middle) < start + DAY_SECONDS:
+            low = middle
+        else:
+            high = middle
+
+    return max(MIN_POLL_DELAY, high)
+
+
+# Conversations are appended to a JSONL log. The index keeps parallel lists
+# of each sender's record offsets and timestamps, so prompts only read the
+# records they need instead of holding the whole history in memory.
+HISTORY_FILE = 'conversation_history.jsonl'
+HISTORY_INDEX_FILE = 'conversation_history.index.json'
+LEGACY_HISTORY_FILE = 'conversation_history.json'
+HISTORY_FIELDS = ('timestamp', 'received', 'subject', 'content', 'response')
+INDEX_FIELDS = ('offset', 'timestamp', 'received')
+
+# Highest message UID already fetched, with the UIDVALIDITY it belongs to
+IMAP_STATE_FILE = 'imap_state.json'
+
+# Conversations kept per sender; older ones are folded into a summary entry
+HISTORY_MAX_ENTRIES = 50
+HISTORY_KEEP_ENTRIES = 20
+
+
+def save_json(path: str, data: Any):
+    """Write data as indented JSON, replacing the file atomically so a crash never truncates it."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        # Get the data on disk before the rename, or a power loss can leave an empty file
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_config(config_path: str) -> Dict:
+    """Read a YAML config, reusing a JSON copy of it until the YAML file changes."""
+    cache_path = config_path + '.cache'
+    mtime = os.stat(config_path).st_mtime_ns
+    try:
+        with open(cache_path, 'rb') as f:
+            cache = orjson.loads(f.read())
+        if cache['mtime'] == mtime:
+            return cache['config']
+    except (OSError, orjson.JSONDecodeError, KeyError, TypeError):
+        pass
+
+    # PyYAML is only imported when the cache can't be used
+    import yaml
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+
+    # Hand the parser the binary file so it decodes and reads it itself
+    with open(config_path, 'rb') as f:
+        config = yaml.load(f, Loader=SafeLoader)
+
+    # The config holds credentials, so the cache is only readable by its owner
+    tmp_path = cache_path + '.tmp'
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'wb') as f:
+            f.write(orjson.dumps({'mtime': mtime, 'config': config}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError) as e:
+        print(f"Could not cache config: {str(e)}")
+
+    return config
+
 
 class BaseEmailAssistant(ABC):
     def __init__(self, config_path: str = 'config.yaml'):
         """Initialize the email assistant with configuration."""
         self.load_config(config_path)
+        self.load_imap_state()
         self.connect_imap()
+        self.drafts_folder = self._find_drafts_folder()
         self.load_history()
         self.load_training_context()
 
     def load_config(self, config_path: str):
         """Load configuration from YAML file."""
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        self.config = read_config(config_path)
+
+        # Match every blacklist entry in a single pass over an address
+        blacklist = self.config.get('blacklist') or []
+        self.blacklist_re = re.compile('|'.join(map(re.escape, blacklist)), re.IGNORECASE) if blacklist else None
+
+        # Let the server drop blacklisted senders before anything is fetched;
+        # entries beyond the cap or outside ASCII are only filtered locally
+        terms = []
+        for blacklisted in blacklist:
+            if len(terms) == BLACKLIST_SEARCH_TERMS:
+                break
+            if blacklisted.isascii():
+                quoted = blacklisted.replace('\\', '\\\\').replace('"', '\\"')
+                terms.append(f'NOT FROM "{quoted}"')
+        self.blacklist_search = ' '.join(terms)
 
     def connect_imap(self):
         """Connect to IMAP server."""
         self.imap = imaplib.IMAP4_SSL(self.config['imap_server'])
         self.imap.login(self.config['email'], self.config['password'])
         self.imap.select('INBOX')
+        # SELECT reports the message count as EXISTS; that isn't new mail
+        self.imap.untagged_responses.pop('EXISTS', None)
+
+        # UIDs from another UIDVALIDITY don't refer to the same messages
+        _, uidvalidity = self.imap.response('UIDVALIDITY')
+        uidvalidity = int(uidvalidity[0]) if uidvalidity and uidvalidity[0] else None
+        if self.imap_state.get('uidvalidity') != uidvalidity:
+            self.imap_state = {'uidvalidity': uidvalidity, 'last_uid': 0}
+
+        # Prefer IDLE push notifications over polling when available
+        _, capabilities = self.imap.capability()
+        capabilities = capabilities[0].upper().split()
+        self.idle_supported = b'IDLE' in capabilities
+        self.multiappend_supported = b'MULTIAPPEND' in capabilities
+        self.imap_last_used = time.monotonic()
+
+    def load_imap_state(self):
+        """Load the highest message UID already fetched."""
+        try:
+            with open(IMAP_STATE_FILE, 'rb') as f:
+                self.imap_state = orjson.loads(f.read())
+        except FileNotFoundError:
+            self.imap_state = {}
+
+    def _ensure_connected(self):
+        """Reconnect to the IMAP server if an idle connection no longer answers NOOP."""
+        if time.monotonic() - self.imap_last_used > IMAP_PROBE_AFTER:
+            try:
+                self.imap.noop()
+            except (imaplib.IMAP4.error, OSError) as e:
+                print(f"IMAP connection lost ({str(e)}), reconnecting")
+                try:
+                    self.imap.shutdown()
+                except OSError:
+                    pass
+                self.connect_imap()
+
+        self.imap_last_used = time.monotonic()
 
     def load_training_context(self):
         """Load training context from JSON file."""
         try:
-            with open('training_context.json', 'r') as f:
-                self.training_context = json.load(f)
+            with open('training_context.json', 'rb') as f:
+                self.training_context = orjson.loads(f.read())
         except FileNotFoundError:
             self.training_context = {
                 'system_prompt': self.config.get('system_prompt', ''),
@@ -41,10 +274,15 @@ class BaseEmailAssistant(ABC):
             }
             self.save_training_context()
 
+        # Sort once here so prompts can take the latest examples without re-sorting
+        self.recent_examples = deque(
+            sorted(self.training_context['example_responses'], key=lambda x: x['timestamp'])[-5:],
+            maxlen=5
+        )
+
     def save_training_context(self):
         """Save training context to JSON file."""
-        with open('training_context.json', 'w') as f:
-            json.dump(self.training_context, f, indent=2)
+        save_json('training_context.json', self.training_context)
 
     def add_instruction(self, instruction: str):
         """Add a new instruction to the training context."""
@@ -57,177 +295,668 @@ class BaseEmailAssistant(ABC):
 
     def add_example_response(self, email_data: Dict, final_response: str):
         """Add a final response as an example to learn from."""
-        self.training_context['example_responses'].append({
+        example = {
             'timestamp': datetime.now().isoformat(),
             'sender': email_data['sender'],
             'subject': email_data['subject'],
             'original_content': email_data['content'],
             'response': final_response
-        })
+        }
+        self.training_context['example_responses'].append(example)
+        self.recent_examples.append(example)
         self.save_training_context()
         print(f"Added final response to training examples")
 
+    def _fetch_messages(self, imap: imaplib.IMAP4, uids: List[bytes]) -> Dict[bytes, Dict]:
+        """Fetch header, text and arrival time sections for the given message UIDs."""
+        messages = {}
+        batch_size = self.config.get('fetch_batch_size', 100)
+
+        # Fetch in batches so N messages cost N / batch_size round-trips
+        for start in range(0, len(uids), batch_size):
+            batch = uids[start:start + batch_size]
+            typ, msg_data = imap.uid('FETCH', b','.join(batch), FETCH_SPEC)
+            if typ != 'OK':
+                raise imaplib.IMAP4.error(f"FETCH failed: {msg_data!r}")
+
+            # Each message comes back as a header and a text tuple followed
+            # by a b')' closer; a sequence number starts each response and the
+            # UID item may sit in any of its parts. imaplib also returns
+            # unsolicited FETCH responses (e.g. flag updates) collected
+            # earlier, so keep only what was asked for.
+            requested = set(batch)
+            fetched = []
+            sections = None
+            for item in msg_data:
+                envelope = item[0] if isinstance(item, tuple) else item
+                if FETCH_NUM_RE.match(envelope):
+                    sections = {}
+                    fetched.append(sections)
+                if sections is None:
+                    continue
+                uid = UID_RE.search(envelope)
+                if uid:
+                    sections['uid'] = uid.group(1)
+                internal_date = imaplib.Internaldate2tuple(envelope)
+                if internal_date:
+                    sections['received'] = time.mktime(internal_date)
+                if isinstance(item, tuple):
+                    section = 'header' if b'HEADER' in item[0] else 'text'
+                    sections[section] = item[1]
+
+            for sections in fetched:
+                uid = sections.pop('uid', None)
+                if uid in requested and 'header' in sections:
+                    messages[uid] = sections
+
+        return messages
+
+    def _fetch_shard(self, uids: List[bytes]) -> Dict[bytes, Dict]:
+        """Fetch messages over a dedicated read-only IMAP connection."""
+        imap = imaplib.IMAP4_SSL(self.config['imap_server'])
+        try:
+            imap.login(self.config['email'], self.config['password'])
+            imap.select('INBOX', readonly=True)
+            return self._fetch_messages(imap, uids)
+        finally:
+            try:
+                imap.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+    @staticmethod
+    def _decode_text(part: email.message.Message) -> str:
+        """Decode a MIME part using its declared charset, replacing undecodable bytes."""
+        payload = part.get_payload(decode=True) or b''
+        charset = part.get_content_charset() or 'utf-8'
+        try:
+            return payload.decode(charset, errors='replace')
+        except LookupError:
+            # Unknown charset name
+            return payload.decode('utf-8', errors='replace')
+
     def get_new_emails(self, search_criteria: str = 'UNSEEN') -> List[Dict]:
         """Get new emails based on search criteria."""
+        self._ensure_connected()
         emails = []
-        _, message_numbers = self.imap.search(None, search_criteria)
-
-        for num in message_numbers[0].split():
+        if self.blacklist_search:
+            search_criteria = f"{search_criteria} {self.blacklist_search}"
+
+        # Only look past the last fetched UID: PEEK leaves skipped and failed
+        # messages unread, and they shouldn't be downloaded again
+        last_uid = self.imap_state['last_uid']
+        search_criteria = f"UID {last_uid + 1}:* {search_criteria}"
+
+        # UIDs rather than sequence numbers, which are per session and shift
+        # on EXPUNGE, so fetch shards and mark_as_read address the same messages
+        typ, message_uids = self.imap.uid('SEARCH', search_criteria)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"SEARCH failed: {message_uids!r}")
+        # n:* always matches the newest message, even when its UID is below n
+        uids = sorted((uid for uid in message_uids[0].split() if int(uid) > last_uid), key=int)
+
+        # Large backlogs are split across several connections fetching in
+        # parallel; providers cap concurrent sessions, hence the small default
+        batch_size = self.config.get('fetch_batch_size', 100)
+        connections = min(self.config.get('max_imap_connections', 3), math.ceil(len(uids) / batch_size))
+        if connections > 1:
+            shard_size = math.ceil(len(uids) / connections)
+            shards = [uids[start:start + shard_size] for start in range(0, len(uids), shard_size)]
+            messages = {}
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                for shard_messages in executor.map(self._fetch_shard, shards):
+                    messages.update(shard_messages)
+        else:
+            messages = self._fetch_messages(self.imap, uids)
+
+        # Only move the mark over messages that actually came back; anything
+        # after a missing one waits for the next search, which no longer
+        # matches the missing message if it was expunged meanwhile
+        handled = []
+        for uid in uids:
+            if uid not in messages:
+                break
+            handled.append(uid)
+        if handled:
+            self.imap_state['last_uid'] = int(handled[-1])
+            save_json(IMAP_STATE_FILE, self.imap_state)
+
+        for uid in handled:
+            sections = messages[uid]
             try:
-                _, msg_data = self.imap.fetch(num, '(RFC822)')
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
+                email_message = email.message_from_bytes(
+                    sections.get('header', b'') + sections.get('text', b'')
+                )
 
-                # Skip blacklisted senders
+                # There is no one to reply to without a sender
                 sender = email_message['from']
-                if any(blacklisted in sender.lower() for blacklisted in self.config.get('blacklist', [])):
+                if not sender:
+                    print(f"Skipping email {uid.decode()} without a sender")
+                    continue
+                sender = str(sender)
+
+                # Skip blacklisted senders
+                if self.blacklist_re and self.blacklist_re.search(sender):
                     continue
 
                 # Skip blacklisted reply-tos if present
                 reply_to = email_message.get('reply-to')
-                if reply_to and any(blacklisted in reply_to.lower() for blacklisted in self.config.get('blacklist', [])):
+                if reply_to and self.blacklist_re and self.blacklist_re.search(reply_to):
                     continue
 
-                # Extract email content
+                # Extract email content; multipart bodies still carry
+                # their MIME parts in BODY[TEXT]
                 content = ""
                 if email_message.is_multipart():
                     for part in email_message.walk():
-                        if part.get_content_type() == "text/plain":
-                            content = part.get_payload(decode=True).decode()
+                        if part.get_content_type() == "text/plain" and not part.is_multipart():
+                            content = self._decode_text(part)
                             break
                 else:
-                    content = email_message.get_payload(decode=True).decode()
+                    content = self._decode_text(email_message)
 
                 emails.append({
-                    'uid': num.decode(),
+                    'uid': uid.decode(),
                     'sender': sender,
                     'subject': email_message['subject'],
-                    'content': content
+                    'content': content,
+                    'received': sections.get('received', time.time())
                 })
             except Exception as e:
-                print(f"Error processing email {num}: {str(e)}")
+                print(f"Error processing email {uid.decode()}: {str(e)}")
                 continue
 
         return emails
 
+    def _build_draft(self, email_data: Dict, response: str) -> bytes:
+        """Build the raw draft message replying to an email."""
+        draft = EmailMessage()
+        draft['To'] = email_data['sender']
+        draft['From'] = self.config['email']
+        draft['Subject'] = f"Re: {email_data['subject']}"
+        draft.set_content(response)
+
+        # Flatten straight to bytes with the CRLF line endings IMAP expects
+        buffer = BytesIO()
+        BytesGenerator(buffer, policy=email.policy.SMTP).flatten(draft)
+        return buffer.getvalue()
+
+    def _find_drafts_folder(self) -> Optional[str]:
+        """Find the drafts folder by its RFC 6154 \\Drafts flag, falling back to common names."""
+        typ, folders = self.imap.list()
+        names = []
+        for line in folders if typ == 'OK' else []:
+            match = LIST_RE.match(line) if isinstance(line, bytes) else None
+            if not match:
+                continue
+            name = match.group('name').decode()
+            if name.startswith('"'):
+                name = name[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+            if b'\\DRAFTS' in match.group('flags').upper():
+                return name
+            names.append(name)
+
+        for folder in DRAFT_FOLDERS:
+            if folder in names:
+                return folder
+        return None
+
+    def _append_draft(self, folder: str, draft: bytes) -> str:
+        """Append a draft to a folder; APPEND names its target, so no SELECT is needed."""
+        typ, _ = self.imap.append(self.imap._quote(folder), '\\Draft', imaplib.Time2Internaldate(time.time()), draft)
+        return typ
+
     def save_draft(self, email_data: Dict, response: str):
         """Save response as draft."""
         try:
-            # Create the draft message
-            draft = EmailMessage()
-            draft['To'] = email_data['sender']
-            draft['From'] = self.config['email']
-            draft['Subject'] = f"Re: {email_data['subject']}"
-            draft.set_content(response)
-
-            # Try common draft folder names
-            draft_folders = ['Drafts', 'Draft', '[Gmail]/Drafts', 'INBOX/Drafts']
-            saved = False
-
-            for folder in draft_folders:
-                try:
-                    self.imap.select(folder)
-                    self.imap.append(folder, '\\Draft', imaplib.Time2Internaldate(time.time()), str(draft).encode())
-                    print(f"Draft saved to {folder} folder for email from {email_data['sender']}")
-                    saved = True
-                    break
-                except:
-                    continue
-
-            if not saved:
-                # If no drafts folder works, save to INBOX
-                self.imap.select('INBOX')
-                self.imap.append('INBOX', '\\Draft', imaplib.Time2Internaldate(time.time()), str(draft).encode())
-                print(f"Draft saved to INBOX for email from {email_data['sender']}")
-
-            # Go back to INBOX
-            self.imap.select('INBOX')
+            self._ensure_connected()
+            draft = self._build_draft(email_data, response)
+
+            # If no drafts folder was found, save to INBOX
+            folder = self.drafts_folder or 'INBOX'
+            typ = self._append_draft(folder, draft)
+            if typ != 'OK' and self.drafts_folder:
+                # The folder may have been renamed or removed; look it up again
+                self.drafts_folder = self._find_drafts_folder()
+                folder = self.drafts_folder or 'INBOX'
+                typ = self._append_draft(folder, draft)
+
+            if typ != 'OK':
+                raise imaplib.IMAP4.error(f"APPEND to {folder} failed")
+            print(f"Draft saved to {folder} folder for email from {email_data['sender']}")
         except Exception as e:
             print(f"Error saving draft: {str(e)}")
             import traceback
             print(f"Full error: {traceback.format_exc()}")
 
+    def _multiappend(self, folder: str, messages: List[bytes]):
+        """Append several messages to a folder with a single RFC 3502 MULTIAPPEND command."""
+        date = imaplib.Time2Internaldate(time.time()).encode()
+        tag = self.imap._new_tag()
+        command = tag + b' APPEND ' + self.imap._quote(folder).encode()
+
+        # imaplib registers tags from _new_tag but only removes those of
+        # commands it completes itself
+        try:
+            # imaplib only supports one literal per command, so send each message
+            # after the server's continuation request
+            for message in messages:
+                self.imap.send(command + b' (\\Draft) ' + date + b' {%d}\r\n' % len(message))
+                line = self.imap.readline()
+                while line.startswith(b'*'):
+                    self._record_exists(line)
+                    line = self.imap.readline()
+                if not line.startswith(b'+'):
+                    raise imaplib.IMAP4.error(f"APPEND rejected by server: {line!r}")
+                self.imap.send(message)
+                command = b''
+            self.imap.send(b'\r\n')
+
+            while True:
+                line = self.imap.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("Connection closed during APPEND")
+                self._record_exists(line)
+                if line.startswith(tag):
+                    if not line.startswith(tag + b' OK'):
+                        raise imaplib.IMAP4.error(f"APPEND failed: {line!r}")
+                    return
+        finally:
+            self.imap.tagged_commands.pop(tag, None)
+
+    def _record_exists(self, line: bytes):
+        """Keep an EXISTS read outside imaplib's parser where idle() will find it."""
+        if self._is_exists(line):
+            self.imap.untagged_responses.setdefault('EXISTS', []).append(line.split()[1])
+
+    def save_drafts(self, drafts: List[Tuple[Dict, str]]):
+        """Save several responses as drafts, using one MULTIAPPEND command when the server supports it."""
+        if len(drafts) > 1 and self.multiappend_supported:
+            folder = self.drafts_folder or 'INBOX'
+            try:
+                self._ensure_connected()
+                self._multiappend(folder, [self._build_draft(*draft) for draft in drafts])
+                for email_data, _ in drafts:
+                    print(f"Draft saved to {folder} folder for email from {email_data['sender']}")
+                return
+            except Exception as e:
+                # MULTIAPPEND is atomic, so nothing was saved; fall back to one at a time
+                print(f"Error saving drafts with MULTIAPPEND: {str(e)}")
+                self.imap_last_used = 0
+
+        for email_data, response in drafts:
+            self.save_draft(email_data, response)
+
     def mark_as_read(self, uid: str):
         """Mark email as read."""
-        self.imap.store(uid, '+FLAGS', '(\Seen)')
+        self._ensure_connected()
+        self.imap.uid('STORE', uid, '+FLAGS', '(\\Seen)')
 
     def load_history(self):
-        """Load conversation history from JSON file."""
+        """Load the conversation history index, migrating or rebuilding it when needed."""
+        if not os.path.exists(HISTORY_FILE) and os.path.exists(LEGACY_HISTORY_FILE):
+            self._migrate_history()
+        open(HISTORY_FILE, 'ab').close()
+
         try:
-            with open('conversation_history.json', 'r') as f:
-                self.history = json.load(f)
+            with open(HISTORY_INDEX_FILE, 'rb') as f:
+                index = orjson.loads(f.read())
         except FileNotFoundError:
-            self.history = {}
+            index = None
+
+        # The index records the log size it covers; a mismatch means a crash
+        # between appending a record and saving the index
+        if index and index['size'] == os.path.getsize(HISTORY_FILE):
+            self.history = index['senders']
+            self.history_records = index['records']
+        else:
+            self._rebuild_history_index()
             self.save_history()
 
+        # Rewrite the log once most of its records have been compacted away
+        live_records = sum(len(columns['offset']) for columns in self.history.values())
+        if self.history_records > 2 * live_records + HISTORY_MAX_ENTRIES:
+            self._rewrite_history()
+
+        # Seed arrival times for adaptive polling from the last week
+        cutoff = time.time() - ARRIVAL_WINDOW
+        self.arrival_times = []
+        for columns in self.history.values():
+            for received in columns['received']:
+                received = datetime.fromisoformat(received).timestamp()
+                if received >= cutoff:
+                    self.arrival_times.append(received)
+
+    def _rebuild_history_index(self):
+        """Rebuild the index by scanning the log, dropping a partially written last line."""
+        self.history = {}
+        self.history_records = 0
+        with open(HISTORY_FILE, 'r+b') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self._index_record(orjson.loads(line), offset)
+                offset += len(line)
+            f.truncate(offset)
+
+    def _rewrite_history(self):
+        """Rewrite the log keeping only the records still referenced by the index."""
+        tmp_path = HISTORY_FILE + '.tmp'
+        with open(HISTORY_FILE, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for columns in self.history.values():
+                offsets = []
+                for offset in columns['offset']:
+                    src.seek(offset)
+                    offsets.append(dst.tell())
+                    dst.write(src.readline())
+                columns['offset'] = offsets
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, HISTORY_FILE)
+
+        self.history_records = sum(len(columns['offset']) for columns in self.history.values())
+        self.save_history()
+
+    def _migrate_history(self):
+        """Convert conversation_history.json into the JSONL log, keeping the old file as a backup."""
+        with open(LEGACY_HISTORY_FILE, 'rb') as f:
+            legacy = orjson.loads(f.read())
+
+        # Write to a temporary file so an interrupted migration is simply redone
+        summaries = {}
+        tmp_path = HISTORY_FILE + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for sender, columns in legacy.items():
+                if isinstance(columns, list):
+                    columns = self._to_columns(columns)
+                if 'summary' in columns:
+                    summaries[sender] = columns['summary']
+                for values in zip(*(columns[field] for field in HISTORY_FIELDS)):
+                    record = dict(zip(HISTORY_FIELDS, values), sender=sender)
+                    f.write(orjson.dumps(record) + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, HISTORY_FILE)
+
+        self._rebuild_history_index()
+        for sender, summary in summaries.items():
+            columns = self.history.get(sender)
+            if columns is None:
+                continue
+            if 'summary' in columns:
+                summary['count'] += columns['summary']['count']
+                summary['until'] = columns['summary']['until']
+            columns['summary'] = summary
+        self.save_history()
+
+    @staticmethod
+    def _to_columns(conversations: List[Dict]) -> Dict:
+        """Convert a list of conversation dicts into parallel per-field lists."""
+        columns = {field: [] for field in HISTORY_FIELDS}
+        for conv in conversations:
+            if conv.get('type') == 'summary':
+                columns['summary'] = conv
+                continue
+            conv.setdefault('received', conv['timestamp'])
+            for field in HISTORY_FIELDS:
+                columns[field].append(conv[field])
+
+        return columns
+
     def save_history(self):
-        """Save conversation history to JSON file."""
-        with open('conversation_history.json', 'w') as f:
-            json.dump(self.history, f, indent=2)
+        """Save the conversation history index to JSON file."""
+        save_json(HISTORY_INDEX_FILE, {
+            'size': os.path.getsize(HISTORY_FILE),
+            'records': self.history_records,
+            'senders': self.history
+        })
 
     def update_history(self, email_data: Dict, response: str):
         """Update conversation history with new interaction."""
-        sender = email_data['sender']
-        if sender not in self.history:
-            self.history[sender] = []
-
-        self.history[sender].append({
+        received = email_data.get('received', time.time())
+        record = {
+            'sender': str(email_data['sender']),
             'timestamp': datetime.now().isoformat(),
+            'received': datetime.fromtimestamp(received).isoformat(),
             'subject': email_data['subject'],
             'content': email_data['content'],
             'response': response
-        })
+        }
+
+        # Appending is O(1) regardless of how much history there is
+        with open(HISTORY_FILE, 'ab') as f:
+            offset = f.tell()
+            f.write(orjson.dumps(record) + b'\n')
+
+        self._index_record(record, offset)
+        self.arrival_times.append(received)
         self.save_history()
 
+    def _index_record(self, record: Dict, offset: int):
+        """Add a logged conversation to its sender's index, compacting past the limit."""
+        # Records logged before senders were validated may hold null
+        sender = str(record['sender'])
+        if sender not in self.history:
+            self.history[sender] = {field: [] for field in INDEX_FIELDS}
+
+        columns = self.history[sender]
+        columns['offset'].append(offset)
+        columns['timestamp'].append(record['timestamp'])
+        columns['received'].append(record['received'])
+        self.history_records += 1
+
+        if len(columns['offset']) > HISTORY_MAX_ENTRIES:
+            self._compact_history(sender)
+
+    def _compact_history(self, sender: str):
+        """Fold all but the most recent conversations with a sender into a single summary entry."""
+        columns = self.history[sender]
+        older = len(columns['offset']) - HISTORY_KEEP_ENTRIES
+
+        summary = columns.get('summary') or {'type': 'summary', 'count': 0, 'since': columns['timestamp'][0]}
+        summary['count'] += older
+        summary['until'] = columns['timestamp'][older - 1]
+        columns['summary'] = summary
+
+        for field in INDEX_FIELDS:
+            columns[field] = columns[field][older:]
+
     def _get_relevant_history(self, sender: str) -> str:
         """Get relevant conversation history for a sender."""
         if sender not in self.history:
             return "No previous conversations found."
 
-        # Get last 5 conversations
-        recent_history = self.history[sender][-5:]
-        history_text = ""
+        # Read the last 5 conversations straight from the log
+        parts = []
+        with open(HISTORY_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            for offset in self.history[sender]['offset'][-5:]:
+                conv = orjson.loads(log[offset:log.find(b'\n', offset)])
+                parts.append(f"Subject: {conv['subject']}\nOriginal: {conv['content']}\nResponse: {conv['response']}\n\n")
 
-        for conv in recent_history:
-            history_text += f"Subject: {conv['subject']}\n"
-            history_text += f"Original: {conv['content']}\n"
-            history_text += f"Response: {conv['response']}\n\n"
+        return "".join(parts)
 
-        return history_text
+    def _build_system_prompt(self) -> str:
+        """Combine the system prompt with additional instructions in the order they were added."""
+        parts = [self.training_context['system_prompt'], "\n\n"]
+        if self.training_context['additional_instructions']:
+            parts.append("Additional Instructions:\n")
+            for inst in self.training_context['additional_instructions']:
+                parts.append(f"- {inst['instruction']}\n")
+
+        return "".join(parts)
+
+    def _build_example_context(self) -> str:
+        """Get the 5 most recent example responses, oldest first so the text only changes when one is added."""
+        if not self.recent_examples:
+            return ""
+
+        parts = ["Recent example responses:\n\n"]
+        for ex in self.recent_examples:
+            parts.append(f"Subject: {ex['subject']}\nOriginal: {ex['original_content']}\nResponse: {ex['response']}\n\n")
+
+        return "".join(parts)
+
+    def _build_email_context(self, email_data: Dict) -> str:
+        """Get the sender's conversation history followed by the email to respond to."""
+        email_context = f"""
+            From: {email_data['sender']}
+            Subject: {email_data['subject']}
+            Content: {email_data['content']}
+            """
+
+        history_context = self._get_relevant_history(email_data['sender'])
+
+        return f"Previous conversations with this sender:\n{history_context}\n\nNew email to respond to:\n{email_context}"
 
     @abstractmethod
     def generate_response(self, email_data: Dict) -> str:
         """Generate response using AI. Must be implemented by child classes."""
         pass
 
+    def idle(self, timeout: int = IDLE_TIMEOUT) -> bool:
+        """Wait in IMAP IDLE until the server reports new mail or the timeout expires."""
+        # EXISTS responses that arrived with earlier commands (APPEND, STORE,
+        # NOOP) mean there is already new mail to fetch
+        if self.imap.untagged_responses.pop('EXISTS', None):
+            return True
+
+        tag = self.imap._new_tag()
+        self.imap.send(tag + b' IDLE\r\n')
+        # imaplib registers tags from _new_tag but only removes those of
+        # commands it completes itself
+        try:
+            new_mail = False
+            line = self._read_line()
+            while line.startswith(b'*'):
+                new_mail = new_mail or self._is_exists(line)
+                line = self._read_line()
+            if not line.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"IDLE rejected by server: {line!r}")
+
+            # Read through imaplib's buffer, which may already hold lines sent
+            # together with the continuation, with a socket timeout for the wait
+            sock = self.imap.sock
+            previous_timeout = sock.gettimeout()
+            deadline = time.monotonic() + timeout
+            try:
+                while not new_mail:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    sock.settimeout(remaining)
+                    try:
+                        line = self._read_line()
+                    except socket.timeout:
+                        # A socket file refuses further reads after a timeout
+                        self.imap.file.close()
+                        self.imap.file = sock.makefile('rb')
+                        break
+                    new_mail = self._is_exists(line)
+            finally:
+                sock.settimeout(previous_timeout)
+
+            # End IDLE and consume everything up to its tagged completion
+            self.imap.send(b'DONE\r\n')
+            while not line.startswith(tag):
+                line = self._read_line()
+
+            return new_mail
+        finally:
+            self.imap.tagged_commands.pop(tag, None)
+
+    def _read_line(self) -> bytes:
+        """Read one raw response line, failing if the server closed the connection."""
+        line = self.imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed during IDLE")
+        return line
+
+    @staticmethod
+    def _is_exists(line: bytes) -> bool:
+        """Whether a response line is an untagged EXISTS, signalling new mail."""
+        return line.startswith(b'*') and line.rstrip().upper().endswith(b'EXISTS')
+
+    def poll_delay(self, interval: int) -> float:
+        """Seconds to wait before the next poll, adapted to past arrivals if polls_per_day is set."""
+        cutoff = time.time() - ARRIVAL_WINDOW
+        self.arrival_times = [t for t in self.arrival_times if t >= cutoff]
+
+        polls_per_day = self.config.get('polls_per_day')
+        if not polls_per_day or len(self.arrival_times) < MIN_ARRIVALS:
+            return interval
+        return next_poll_delay(self.arrival_times, polls_per_day, time.time())
+
+    def wait_for_new_mail(self, interval: int):
+        """Block until new mail may have arrived, using IDLE or NOOP polling."""
+        if self.idle_supported:
+            self.idle()
+        else:
+            time.sleep(self.poll_delay(interval))
+            self.imap.noop()
+        self.imap_last_used = time.monotonic()
+
     def run(self, interval: int = 300, search_criteria: str = 'UNSEEN'):
-        """Run the email assistant with specified check interval."""
+        """Run the email assistant, polling every interval seconds when IDLE is unavailable."""
+        retry_delay = RETRY_DELAY_MIN
         while True:
             try:
                 print(f"Checking for new emails at {datetime.now()}")
                 new_emails = self.get_new_emails(search_criteria)
 
-                for email_data in new_emails:
-                    try:
+                # Generate responses concurrently, collecting drafts to save together
+                drafts = []
+                executor = ThreadPoolExecutor(max_workers=self.config.get('llm_concurrency', 4))
+                try:
+                    futures = {}
+                    for email_data in new_emails:
                         print(f"Processing email from {email_data['sender']}")
-                        response = self.generate_response(email_data)
+                        futures[executor.submit(self.generate_response, email_data)] = email_data
+
+                    for future in as_completed(futures):
+                        email_data = futures[future]
+                        try:
+                            response = future.result()
+                        except Exception as e:
+                            print(f"Error processing email from {email_data['sender']}: {str(e)}")
+                            continue
                         if response and not response.startswith("Error generating"):
-                            self.save_draft(email_data, response)
-                            self.update_history(email_data, response)
-
-                            if self.config.get('mark_as_read', True):
-                                self.mark_as_read(email_data['uid'])
-
-                            print(f"Draft saved for email from {email_data['sender']}")
+                            drafts.append((email_data, response))
                         else:
                             print(f"Skipping draft save due to error for {email_data['sender']}")
+                except BaseException:
+                    # On shutdown or error, drop the queued LLM calls rather than
+                    # waiting them all out; running ones end within llm_timeout
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+                executor.shutdown()
+
+                self.save_drafts(drafts)
+
+                for email_data, response in drafts:
+                    try:
+                        self.update_history(email_data, response)
+
+                        if self.config.get('mark_as_read', True):
+                            self.mark_as_read(email_data['uid'])
+
+                        print(f"Draft saved for email from {email_data['sender']}")
                     except Exception as e:
                         print(f"Error processing email from {email_data['sender']}: {str(e)}")
+                        self.imap_last_used = 0  # Probe the connection before reusing it
                         continue
 
-                time.sleep(interval)
+                self.wait_for_new_mail(interval)
+                retry_delay = RETRY_DELAY_MIN
             except Exception as e:
                 print(f"Error occurred in main loop: {str(e)}")
                 import traceback
                 print(f"Full error: {traceback.format_exc()}")
-                time.sleep(60)  # Wait a minute before retrying
+                self.imap_last_used = 0  # Probe the connection before reusing it
+
+                # Back off while errors repeat; jitter keeps several instances
+                # from retrying in step
+                wait = retry_delay + random.uniform(0, retry_delay * 0.1)
+                print(f"Retrying in {wait:.0f} seconds")
+                time.sleep(wait)
+                retry_delay = min(retry_delay * 2, RETRY_DELAY_MAX)
@@ -1,8 +1,6 @@
 from google.generativeai import GenerativeModel
 from typing import Dict
-from datetime import datetime
-import time
-from base_email_assistant import BaseEmailAssistant
+from base_email_assistant import BaseEmailAssistant, LLM_TIMEOUT
 
 class EmailAssistant(BaseEmailAssistant):
     def __init__(self, config_path: str = 'config.yaml'):
@@ -15,40 +13,11 @@ class EmailAssistant(BaseEmailAssistant):
     def generate_response(self, email_data: Dict) -> str:
         """Generate response using Google Gemini API with full training context."""
         try:
-            # Combine all instructions
-            full_system_prompt = self.training_context['system_prompt'] + "\n\n"
-            if self.training_context['additional_instructions']:
-                full_system_prompt += "Additional Instructions:\n"
-                for inst in self.training_context['additional_instructions']:
-                    full_system_prompt += f"- {inst['instruction']}\n"
-
-            # Create context from examples
-            example_context = ""
-            if self.training_context['example_responses']:
-                recent_examples = sorted(
-                    self.training_context['example_responses'],
-                    key=lambda x: x['timestamp'],
-                    reverse=True
-                )[:5]  # Get 5 most recent examples
-
-                example_context = "Recent example responses:\n\n"
-                for ex in recent_examples:
-                    example_context += f"Subject: {ex['subject']}\n"
-                    example_context += f"Original: {ex['original_content']}\n"
-                    example_context += f"Response: {ex['response']}\n\n"
-
-            # Current email context
-            email_context = f"""
-            From: {email_data['sender']}
-            Subject: {email_data['subject']}
-            Content: {email_data['content']}
-            """
-
-            # Get conversation history for this sender
-            history_context = self._get_relevant_history(email_data['sender'])
+            example_context = self._build_example_context()
+            email_context = self._build_email_context(email_data)
 
             # Combine all context
-            full_context = f"{example_context}\n\nPrevious conversations with this sender:\n{history_context}\n\nNew email to respond to:\n{email_context}"
+            full_context = f"{example_context}\n\n{email_context}"
 
             # Generate response using Gemini
             response = self.model.generate_content(
@@ -56,7 +25,8 @@ class EmailAssistant(BaseEmailAssistant):
                 generation_config={
                     'temperature': self.config.get('temperature', 0.7),
                     'max_output_tokens': self.config.get('max_tokens', 1000)
-                }
+                },
+                request_options={'timeout': self.config.get('llm_timeout', LLM_TIMEOUT)}
             )
 
             return response.text
@@ -68,38 +38,6 @@ class EmailAssistant(BaseEmailAssistant):
             print(f"Full error: {traceback.format_exc()}")
             return "Error generating response. Please check the logs for details."
 
-    def run(self, interval: int = 300, search_criteria: str = 'UNSEEN'):
-        """Run the email assistant with specified check interval."""
-        while True:
-            try:
-                print(f"Checking for new emails at {datetime.now()}")
-                new_emails = self.get_new_emails(search_criteria)
-
-                for email_data in new_emails:
-                    try:
-                        print(f"Processing email from {email_data['sender']}")
-                        response = self.generate_response(email_data)
-                        if response and not response.startswith("Error generating"):
-                            self.save_draft(email_data, response)
-                            self.update_history(email_data, response)
-
-                            if self.config.get('mark_as_read', True):
-                                self.mark_as_read(email_data['uid'])
-
-                            print(f"Draft saved for email from {email_data['sender']}")
-                        else:
-                            print(f"Skipping draft save due to error for {email_data['sender']}")
-                    except Exception as e:
-                        print(f"Error processing email from {email_data['sender']}: {str(e)}")
-                        continue
-
-                time.sleep(interval)
-            except Exception as e:
-                print(f"Error occurred in main loop: {str(e)}")
-                import traceback
-                print(f"Full error: {traceback.format_exc()}")
-                time.sleep(60)  # Wait a minute before retrying
-
 if __name__ == "__main__":
     assistant = EmailAssistant()
 
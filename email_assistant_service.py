@@ -1,77 +1,132 @@
 #!/usr/bin/env python3
 import sys
+import atexit
+import functools
 import logging
-from logging.handlers import RotatingFileHandler
-import traceback
+import queue
+import random
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, RotatingFileHandler
+import threading
 import time
 import signal
-import yaml
 from typing import Dict, Optional
+from base_email_assistant import read_config
 
 # Global variables for health check
-start_time = time.time()
+start_time = time.monotonic()
 last_error_time: Optional[float] = None
 last_error_message: Optional[str] = None
 
+# Shared by all log handlers; timestamps are to the second
+_LOG_FORMAT = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+# Repeated health checks within this many seconds reuse the last result
+HEALTH_CHECK_TTL = 5
+_last_check_time = 0.0
+_last_check_value: Optional[Dict] = None
+
+# Set once a shutdown signal has been handled
+_shutdown_started = threading.Event()
+
+# Restart delay after a crash doubles from the minimum up to the maximum
+RESTART_DELAY_MIN = 5
+RESTART_DELAY_MAX = 300
+
+_REQUIRED = frozenset(('email', 'password', 'imap_server'))
+
+# Model setting, the API key it needs, and the error when the key is missing
+_PROVIDER_KEYS = (
+    ('openai_model_name', 'openai_api_key', "OpenAI API key is required when using OpenAI models"),
+    ('claude_model_name', 'anthropic_api_key', "Anthropic API key is required when using Claude models"),
+    ('gemini_model_name', 'google_api_key', "Google API key is required when using Gemini models"),
+)
+
+# Validated configuration, loaded once per process
+_CONFIG_CACHE: Optional[Dict] = None
+
 def validate_config(config: Dict) -> None:
     """Validate required configuration."""
-    required_fields = ['email', 'password', 'imap_server']
-    for field in required_fields:
-        if field not in config:
-            raise ValueError(f"Missing required configuration: {field}")
+    missing = _REQUIRED.difference(config)
+    if missing:
+        raise ValueError(f"Missing required configuration: {', '.join(sorted(missing))}")
 
     # Validate API keys based on model selection
-    if 'openai_model_name' in config and 'openai_api_key' not in config:
-        raise ValueError("OpenAI API key is required when using OpenAI models")
-    if 'claude_model_name' in config and 'anthropic_api_key' not in config:
-        raise ValueError("Anthropic API key is required when using Claude models")
-    if 'gemini_model_name' in config and 'google_api_key' not in config:
-        raise ValueError("Google API key is required when using Gemini models")
+    for model_field, key_field, error in _PROVIDER_KEYS:
+        if model_field in config and key_field not in config:
+            raise ValueError(error)
 
 def health_check() -> Dict:
-    """Simple health check endpoint."""
-    return {
+    """Simple health check endpoint, answered from cache for HEALTH_CHECK_TTL seconds."""
+    global _last_check_time, _last_check_value
+    now = time.monotonic()
+    if _last_check_value is not None and now - _last_check_time < HEALTH_CHECK_TTL:
+        return _last_check_value
+
+    _last_check_value = {
         'status': 'healthy',
-        'uptime': time.time() - start_time,
+        'uptime': now - start_time,
         'last_error': {
             'time': last_error_time,
             'message': last_error_message
         } if last_error_time else None
     }
+    _last_check_time = now
+    return _last_check_value
+
+def flush_periodically(handler: logging.Handler, interval: float):
+    """Flush a buffering log handler every interval seconds."""
+    while True:
+        time.sleep(interval)
+        handler.flush()
 
 def setup_logging():
     """Setup logging configuration"""
     logger = logging.getLogger('EmailAssistant')
+    # Already set up; adding handlers again would duplicate every record
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
 
     # Create handlers
     file_handler = RotatingFileHandler(
         '/var/log/email-assistant/email-assistant.log',
         maxBytes=10485760,  # 10MB
-        backupCount=5
+        backupCount=5,
+        delay=True
     )
     console_handler = logging.StreamHandler(sys.stdout)
 
-    # Create formatters and add it to handlers
-    log_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S,%f'[:-3]  # Truncate microseconds to 3 digits
-    )
-    file_handler.setFormatter(log_format)
-    console_handler.setFormatter(log_format)
+    file_handler.setFormatter(_LOG_FORMAT)
+    console_handler.setFormatter(_LOG_FORMAT)
 
-    # Add handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Write the log file in batches, immediately for errors and at least every
+    # 30 seconds otherwise; logging's own exit hook flushes what's left
+    buffered_handler = MemoryHandler(100, flushLevel=logging.ERROR, target=file_handler, flushOnClose=True)
+    threading.Thread(target=flush_periodically, args=(buffered_handler, 30), daemon=True).start()
+
+    # Log calls only enqueue the record; a listener thread does the writing.
+    # Stopping it at exit drains whatever is still queued.
+    log_queue = queue.Queue(-1)
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, buffered_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
     return logger
 
-def load_config(config_path: str = 'config.yaml') -> Dict:
-    """Load and validate configuration."""
+def load_config(config_path: str = 'config.yaml', force: bool = False) -> Dict:
+    """Load and validate configuration, reusing the first result unless forced."""
+    global _CONFIG_CACHE
+    if _CONFIG_CACHE is not None and not force:
+        return _CONFIG_CACHE
+
     try:
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+        config = read_config(config_path)
         validate_config(config)
+        _CONFIG_CACHE = config
         return config
     except Exception as e:
         raise ValueError(f"Configuration error: {str(e)}")
@@ -79,16 +134,16 @@ def load_config(config_path: str = 'config.yaml') -> Dict:
 def shutdown_handler(signum: int, frame: Optional[object], logger: logging.Logger, assistant: Optional[object] = None):
     """Handle graceful shutdown."""
     # Prevent multiple shutdown calls
-    if hasattr(shutdown_handler, 'called'):
+    if _shutdown_started.is_set():
         return
-    shutdown_handler.called = True
+    _shutdown_started.set()
 
-    logger.info(f"Received shutdown signal {signum}, stopping service...")
+    logger.info("Received shutdown signal %s, stopping service...", signum)
     if assistant and hasattr(assistant, 'imap'):
         try:
             assistant.imap.logout()
         except Exception as e:
-            logger.error(f"Error during IMAP logout: {str(e)}")
+            logger.error("Error during IMAP logout: %s", e)
     sys.exit(0)
 
 def main():
@@ -101,8 +156,8 @@ def main():
     try:
         # Load and validate configuration
         config = load_config()
-        logger.info(f"Loaded configuration for email: {config['email']}")
-        logger.info(f"Using IMAP server: {config['imap_server']}")
+        logger.info("Loaded configuration for email: %s", config['email'])
+        logger.info("Using IMAP server: %s", config['imap_server'])
 
         # Import and initialize the appropriate assistant
         if 'openai_model_name' in config:
@@ -121,29 +176,36 @@ def main():
             raise ValueError("No AI model specified in configuration")
 
         # Setup signal handlers for graceful shutdown
-        def signal_handler(signum, frame):
-            shutdown_handler(signum, frame, logger, assistant)
-
-        signal.signal(signal.SIGTERM, signal_handler)
-        signal.signal(signal.SIGINT, signal_handler)
+        handler = functools.partial(shutdown_handler, logger=logger, assistant=assistant)
+        signal.signal(signal.SIGTERM, handler)
+        signal.signal(signal.SIGINT, handler)
 
+        delay = RESTART_DELAY_MIN
         while True:
+            started = time.monotonic()
             try:
                 logger.info("Running Email Assistant main loop")
                 assistant.run()
             except Exception as e:
                 last_error_time = time.time()
                 last_error_message = str(e)
-                logger.error(f"Error in main loop: {str(e)}")
-                logger.error(traceback.format_exc())
-                logger.info("Restarting in 60 seconds...")
-                time.sleep(60)
+                logger.exception("Error in main loop: %s", e)
+
+                # Back off while crashes repeat; a run that stayed up longer than
+                # the maximum delay starts over from the minimum
+                if time.monotonic() - started > RESTART_DELAY_MAX:
+                    delay = RESTART_DELAY_MIN
+                wait = delay + random.uniform(0, delay * 0.1)
+                logger.info("Restarting in %.0f seconds...", wait)
+                # Wake immediately if a shutdown signal arrives meanwhile
+                if _shutdown_started.wait(wait):
+                    break
+                delay = min(delay * 2, RESTART_DELAY_MAX)
 
     except Exception as e:
         last_error_time = time.time()
         last_error_message = str(e)
-        logger.error(f"Fatal error: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Fatal error: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":
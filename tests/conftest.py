@@ -0,0 +1,16 @@
+import pytest
+
+from base_email_assistant import BaseEmailAssistant
+
+
+class Assistant(BaseEmailAssistant):
+    def generate_response(self, email_data):
+        return ''
+
+
+@pytest.fixture
+def assistant():
+    """An assistant with no IMAP connection or files loaded."""
+    assistant = Assistant.__new__(Assistant)
+    assistant.config = {}
+    return assistant
@@ -0,0 +1,54 @@
+import pytest
+
+from base_email_assistant import LIST_RE
+
+
+class FakeIMAP:
+    def __init__(self, typ, folders):
+        self.typ = typ
+        self.folders = folders
+
+    def list(self):
+        return self.typ, self.folders
+
+
+@pytest.mark.parametrize('line, flags, name', [
+    (b'(\\HasNoChildren) "/" INBOX', b'\\HasNoChildren', b'INBOX'),
+    (b'(\\HasNoChildren \\Drafts) "/" "[Gmail]/Drafts"', b'\\HasNoChildren \\Drafts', b'"[Gmail]/Drafts"'),
+    (b'() "." "My Drafts"', b'', b'"My Drafts"'),
+    (b'(\\Noselect) NIL Archive', b'\\Noselect', b'Archive'),
+])
+def test_list_re(line, flags, name):
+    match = LIST_RE.match(line)
+
+    assert match.group('flags') == flags
+    assert match.group('name') == name
+
+
+def test_drafts_flag_wins(assistant):
+    assistant.imap = FakeIMAP('OK', [
+        b'(\\HasNoChildren) "/" Drafts',
+        b'(\\HasNoChildren \\Drafts) "/" "Brouillons \\"perso\\""',
+    ])
+
+    assert assistant._find_drafts_folder() == 'Brouillons "perso"'
+
+
+def test_drafts_by_name(assistant):
+    assistant.imap = FakeIMAP('OK', [
+        b'(\\HasNoChildren) "/" INBOX',
+        (b'(\\HasNoChildren) "/" {7}', b'Odd One'),
+        b'(\\HasNoChildren) "/" "INBOX/Drafts"',
+    ])
+
+    assert assistant._find_drafts_folder() == 'INBOX/Drafts'
+
+
+@pytest.mark.parametrize('typ, folders', [
+    ('OK', [b'(\\HasNoChildren) "/" INBOX']),
+    ('NO', [b'LIST failed']),
+])
+def test_no_drafts_folder(assistant, typ, folders):
+    assistant.imap = FakeIMAP(typ, folders)
+
+    assert assistant._find_drafts_folder() is None
@@ -0,0 +1,127 @@
+import imaplib
+import time
+
+import orjson
+import pytest
+
+from base_email_assistant import FETCH_SPEC, IMAP_STATE_FILE
+
+HEADER = b'From: alice@example.com\r\nSubject: Hello\r\n\r\n'
+
+
+class FakeIMAP:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.commands = []
+        self.uid_status = 'OK'
+
+    def uid(self, command, uids, spec):
+        self.commands.append((command, uids, spec))
+        return self.uid_status, self.responses.pop(0)
+
+
+def message(seq, uid, text=b'Hi', uid_last=False):
+    """The parts imaplib returns for one FETCH response."""
+    uid_item = b'' if uid_last else b'UID %d ' % uid
+    return [
+        (b'%d (%sINTERNALDATE "01-Jan-2026 10:00:00 +0000" '
+         b'BODY[HEADER.FIELDS (FROM SUBJECT)] {%d}' % (seq, uid_item, len(HEADER)), HEADER),
+        (b' BODY[TEXT] {%d}' % len(text), text),
+        b' UID %d)' % uid if uid_last else b')',
+    ]
+
+
+def test_fetch_by_uid(assistant):
+    imap = FakeIMAP(message(1, 10) + message(2, 11, b'Second'))
+
+    messages = assistant._fetch_messages(imap, [b'10', b'11'])
+
+    assert imap.commands == [('FETCH', b'10,11', FETCH_SPEC)]
+    assert messages[b'10']['header'] == HEADER
+    assert messages[b'10']['text'] == b'Hi'
+    assert messages[b'11']['text'] == b'Second'
+    assert 'received' in messages[b'10']
+
+
+def test_uid_after_the_literals(assistant):
+    imap = FakeIMAP(message(4, 20, uid_last=True))
+
+    assert list(assistant._fetch_messages(imap, [b'20'])) == [b'20']
+
+
+def test_unsolicited_responses_are_dropped(assistant):
+    imap = FakeIMAP(
+        [b'3 (FLAGS (\\Seen))']
+        + message(1, 10)
+        + [b'7 (UID 99 FLAGS ())', b'2 (UID 10 FLAGS (\\Seen))']
+        + message(5, 12)
+    )
+
+    messages = assistant._fetch_messages(imap, [b'10', b'11'])
+
+    assert list(messages) == [b'10']
+    assert messages[b'10']['text'] == b'Hi'
+
+
+def test_fetch_in_batches(assistant):
+    assistant.config['fetch_batch_size'] = 2
+    imap = FakeIMAP(message(1, 1) + message(2, 2), message(3, 3))
+
+    messages = assistant._fetch_messages(imap, [b'1', b'2', b'3'])
+
+    assert [command[1] for command in imap.commands] == [b'1,2', b'3']
+    assert sorted(messages) == [b'1', b'2', b'3']
+
+
+class FakeMailbox(FakeIMAP):
+    def __init__(self, search, *responses):
+        super().__init__(*responses)
+        self.search = search
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            self.commands.append((command,) + args)
+            return 'OK', [self.search]
+        return super().uid(command, *args)
+
+
+@pytest.fixture
+def inbox(assistant, tmp_path, monkeypatch):
+    """An assistant reading from a fake mailbox, keeping its state in a scratch directory."""
+    monkeypatch.chdir(tmp_path)
+    assistant.blacklist_search = ''
+    assistant.blacklist_re = None
+    assistant.imap_state = {'uidvalidity': 1, 'last_uid': 10}
+    assistant.imap_last_used = time.monotonic()
+    return assistant
+
+
+def test_new_emails_advance_the_uid_mark(inbox):
+    inbox.imap = FakeMailbox(b'10 11 12', message(1, 11) + message(2, 12))
+
+    emails = inbox.get_new_emails()
+
+    assert inbox.imap.commands[0] == ('SEARCH', 'UID 11:* UNSEEN')
+    assert [email_data['uid'] for email_data in emails] == ['11', '12']
+    assert emails[0]['sender'] == 'alice@example.com'
+    with open(IMAP_STATE_FILE, 'rb') as f:
+        assert orjson.loads(f.read())['last_uid'] == 12
+
+
+def test_failed_fetch_keeps_the_uid_mark(inbox):
+    inbox.imap = FakeMailbox(b'11 12 13', [b'Some messages could not be FETCHed (Failure)'])
+    inbox.imap.uid_status = 'NO'
+
+    with pytest.raises(imaplib.IMAP4.error):
+        inbox.get_new_emails()
+
+    assert inbox.imap_state['last_uid'] == 10
+
+
+def test_uid_mark_stops_before_a_missing_message(inbox):
+    inbox.imap = FakeMailbox(b'11 12 13', message(1, 11) + message(3, 13))
+
+    emails = inbox.get_new_emails()
+
+    assert [email_data['uid'] for email_data in emails] == ['11']
+    assert inbox.imap_state['last_uid'] == 11
@@ -0,0 +1,94 @@
+import orjson
+import pytest
+
+from base_email_assistant import (
+    HISTORY_FILE, HISTORY_INDEX_FILE, HISTORY_KEEP_ENTRIES, HISTORY_MAX_ENTRIES, LEGACY_HISTORY_FILE
+)
+
+
+@pytest.fixture
+def history(assistant, tmp_path, monkeypatch):
+    """An assistant with an empty history in a scratch directory."""
+    monkeypatch.chdir(tmp_path)
+    assistant.load_history()
+    return assistant
+
+
+def reply(assistant, sender, subject):
+    assistant.update_history({'sender': sender, 'subject': subject, 'content': 'Question'}, f'Answer to {subject}')
+
+
+def test_history_survives_reload(history):
+    reply(history, 'alice@example.com', 'First')
+    reply(history, 'bob@example.com', 'Other')
+    reply(history, 'alice@example.com', 'Second')
+
+    history.load_history()
+
+    context = history._get_relevant_history('alice@example.com')
+    assert context.index('Subject: First') < context.index('Subject: Second')
+    assert 'Other' not in context
+    assert history._get_relevant_history('carol@example.com') == "No previous conversations found."
+
+
+def test_torn_last_line_is_dropped(history):
+    reply(history, 'alice@example.com', 'Kept')
+    with open(HISTORY_FILE, 'ab') as f:
+        f.write(b'{"sender": "alice@example.com", "subj')
+
+    history.load_history()
+    reply(history, 'alice@example.com', 'After')
+    history.load_history()
+
+    context = history._get_relevant_history('alice@example.com')
+    assert 'Subject: Kept' in context
+    assert 'Subject: After' in context
+    assert history.history_records == 2
+
+
+def test_stale_index_is_rebuilt(history):
+    reply(history, 'alice@example.com', 'Indexed')
+    with open(HISTORY_INDEX_FILE, 'rb') as f:
+        index = f.read()
+    reply(history, 'alice@example.com', 'Not indexed')
+    with open(HISTORY_INDEX_FILE, 'wb') as f:
+        f.write(index)
+
+    history.load_history()
+
+    assert 'Subject: Not indexed' in history._get_relevant_history('alice@example.com')
+
+
+def test_missing_sender_does_not_break_loading(history):
+    reply(history, None, 'No sender')
+
+    history.load_history()
+
+    assert 'Subject: No sender' in history._get_relevant_history('None')
+
+
+def test_compaction_keeps_recent_conversations(history):
+    for i in range(HISTORY_MAX_ENTRIES + 1):
+        reply(history, 'alice@example.com', f'Message {i}')
+
+    columns = history.history['alice@example.com']
+    assert len(columns['offset']) == HISTORY_KEEP_ENTRIES
+    assert columns['summary']['count'] == HISTORY_MAX_ENTRIES + 1 - HISTORY_KEEP_ENTRIES
+    assert f'Subject: Message {HISTORY_MAX_ENTRIES}\n' in history._get_relevant_history('alice@example.com')
+
+
+def test_legacy_history_is_migrated(assistant, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conversation = {'timestamp': '2026-01-01T10:00:00', 'subject': 'Old', 'content': 'Question', 'response': 'Answer'}
+    summary = {'type': 'summary', 'count': 7, 'since': '2025-01-01T00:00:00', 'until': '2025-12-01T00:00:00'}
+    with open(LEGACY_HISTORY_FILE, 'wb') as f:
+        f.write(orjson.dumps({'alice@example.com': [summary, conversation]}))
+    # Left behind by an interrupted migration
+    with open(HISTORY_FILE + '.tmp', 'wb') as f:
+        f.write(b'{"sender": "alice@exa')
+
+    assistant.load_history()
+
+    assert 'Subject: Old' in assistant._get_relevant_history('alice@example.com')
+    assert assistant.history['alice@example.com']['summary'] == summary
+    assert (tmp_path / LEGACY_HISTORY_FILE).exists()
@@ -0,0 +1,86 @@
+import imaplib
+import socket
+import threading
+import time
+
+import pytest
+
+
+class FakeIMAP:
+    """The parts of imaplib.IMAP4 idle() uses, over one end of a socket pair."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        self.tagged_commands = {}
+        self.untagged_responses = {}
+
+    def _new_tag(self):
+        self.tagged_commands[b'A1'] = None
+        return b'A1'
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+
+@pytest.fixture
+def server(assistant):
+    """Answer each line the assistant sends with the next scripted reply."""
+    client, server_sock = socket.socketpair()
+    assistant.imap = FakeIMAP(client)
+    received = []
+
+    def serve(replies):
+        lines = server_sock.makefile('rb')
+        for reply in replies:
+            received.append(lines.readline())
+            server_sock.sendall(reply)
+
+    def start(*replies):
+        threading.Thread(target=serve, args=(replies,), daemon=True).start()
+        return received
+
+    yield start
+    client.close()
+    server_sock.close()
+
+
+def test_exists_sent_with_the_continuation(assistant, server):
+    received = server(b'+ idling\r\n* 3 EXISTS\r\n', b'A1 OK IDLE terminated\r\n')
+
+    begun = time.monotonic()
+    assert assistant.idle(timeout=5) is True
+    assert time.monotonic() - begun < 1
+    assert received == [b'A1 IDLE\r\n', b'DONE\r\n']
+    assert assistant.imap.tagged_commands == {}
+
+
+def test_pending_exists_skips_idle(assistant, server):
+    received = server()
+    assistant.imap.untagged_responses['EXISTS'] = [b'4']
+
+    assert assistant.idle(timeout=5) is True
+    assert received == []
+    assert 'EXISTS' not in assistant.imap.untagged_responses
+
+
+def test_timeout_leaves_the_connection_usable(assistant, server):
+    server(b'* 1 RECENT\r\n+ idling\r\n', b'A1 OK IDLE terminated\r\n', b'A2 OK NOOP completed\r\n')
+
+    begun = time.monotonic()
+    assert assistant.idle(timeout=0.3) is False
+    assert time.monotonic() - begun >= 0.3
+
+    assistant.imap.send(b'A2 NOOP\r\n')
+    assert assistant.imap.readline() == b'A2 OK NOOP completed\r\n'
+
+
+def test_idle_rejected(assistant, server):
+    server(b'A1 BAD Command unknown\r\n')
+
+    with pytest.raises(imaplib.IMAP4.error):
+        assistant.idle(timeout=5)
+    assert assistant.imap.tagged_commands == {}
@@ -0,0 +1,64 @@
+import imaplib
+import re
+
+import pytest
+
+
+class FakeIMAP:
+    """Replays server lines in response to the raw commands a test sends."""
+
+    def __init__(self, *lines):
+        self.lines = list(lines)
+        self.sent = []
+        self.tagged_commands = {}
+        self.untagged_responses = {}
+
+    def _new_tag(self):
+        self.tagged_commands[b'A1'] = None
+        return b'A1'
+
+    def _quote(self, arg):
+        return '"' + arg + '"'
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def readline(self):
+        return self.lines.pop(0) if self.lines else b''
+
+
+def test_multiappend_sends_every_message(assistant):
+    assistant.imap = FakeIMAP(b'+ Ready\r\n', b'+ Ready\r\n', b'A1 OK APPEND completed\r\n')
+
+    assistant._multiappend('Drafts', [b'First', b'Second draft'])
+
+    sent = b''.join(assistant.imap.sent)
+    date = re.search(rb'"\d[^"]*"', sent).group()
+    assert sent == (
+        b'A1 APPEND "Drafts" (\\Draft) ' + date + b' {5}\r\nFirst'
+        b' (\\Draft) ' + date + b' {12}\r\nSecond draft\r\n'
+    )
+    assert assistant.imap.tagged_commands == {}
+
+
+def test_multiappend_keeps_new_mail_for_idle(assistant):
+    assistant.imap = FakeIMAP(
+        b'* 5 EXISTS\r\n', b'+ Ready\r\n', b'* 6 EXISTS\r\n', b'* 1 RECENT\r\n', b'A1 OK APPEND completed\r\n'
+    )
+
+    assistant._multiappend('Drafts', [b'Draft'])
+
+    assert assistant.imap.untagged_responses == {'EXISTS': [b'5', b'6']}
+
+
+@pytest.mark.parametrize('lines, error', [
+    ([b'A1 NO [TRYCREATE] No such mailbox\r\n'], imaplib.IMAP4.error),
+    ([b'+ Ready\r\n', b'A1 NO [OVERQUOTA] Quota exceeded\r\n'], imaplib.IMAP4.error),
+    ([b'+ Ready\r\n'], imaplib.IMAP4.abort),
+])
+def test_multiappend_failures(assistant, lines, error):
+    assistant.imap = FakeIMAP(*lines)
+
+    with pytest.raises(error):
+        assistant._multiappend('Drafts', [b'Draft'])
+    assert assistant.imap.tagged_commands == {}
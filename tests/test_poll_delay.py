@@ -0,0 +1,24 @@
+from base_email_assistant import DAY_SECONDS, MIN_POLL_DELAY, next_poll_delay
+
+HOUR = 60 * 60
+
+# A week of mail arriving between 08:40 and 09:20
+MORNING_ARRIVALS = [day * DAY_SECONDS + 9 * HOUR + minute * 60 for day in range(7) for minute in range(-20, 21, 4)]
+
+
+def test_uniform_arrivals_spread_polls_evenly():
+    arrivals = [i * DAY_SECONDS / 500 for i in range(500)]
+
+    for now in (0, 12345, 20 * HOUR):
+        assert abs(next_poll_delay(arrivals, 96, now) - DAY_SECONDS / 96) < 0.05 * DAY_SECONDS / 96
+
+
+def test_polls_are_denser_when_mail_usually_arrives():
+    before_peak = next_poll_delay(MORNING_ARRIVALS, 24, 8 * HOUR + 55 * 60)
+    at_night = next_poll_delay(MORNING_ARRIVALS, 24, 3 * HOUR)
+
+    assert before_peak < DAY_SECONDS / 24 < at_night
+
+
+def test_delay_has_a_floor():
+    assert next_poll_delay(MORNING_ARRIVALS, 10000, 9 * HOUR) == MIN_POLL_DELAY
@@ -0,0 +1,39 @@
+import signal
+import threading
+import time
+
+import pytest
+
+
+def test_interrupt_cancels_queued_responses(assistant):
+    started = []
+
+    def generate_response(email_data):
+        started.append(email_data['uid'])
+        time.sleep(0.5)
+        return 'Reply'
+
+    assistant.config['llm_concurrency'] = 2
+    assistant.get_new_emails = lambda search_criteria: [
+        {'uid': str(uid), 'sender': 'alice@example.com', 'subject': 'Hi', 'content': 'Hello'} for uid in range(20)
+    ]
+    assistant.generate_response = generate_response
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    previous = signal.signal(signal.SIGALRM, interrupt)
+    signal.setitimer(signal.ITIMER_REAL, 0.2)
+    begun = time.monotonic()
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            assistant.run()
+        for thread in threading.enumerate():
+            if thread is not threading.main_thread():
+                thread.join()
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+
+    # Only the two calls already running finish; the other 18 never start
+    assert len(started) == 2
+    assert time.monotonic() - begun < 2